@@ -8,17 +8,182 @@ OsuToLibrary - osuファイルから音楽情報を抽出し、Spotifyライブ
 """
 
 import os
-import re
+import atexit
 import json
+import mmap
+import random
+import re
+import threading
+import time
+from enum import IntEnum
 import requests
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from typing import Dict, List, Optional, Tuple
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import argparse
 import sys
 from pathlib import Path
 
 
+# osuファイルから抽出するフィールド（セクション名 -> {プレフィックス: キー}）
+# ファイルはバイト列のまま走査し、取り出した値だけをデコードする
+_OSU_FIELDS = {
+    b'General': {
+        b'AudioFilename:': 'audio_filename',
+    },
+    b'Metadata': {
+        b'Title:': 'title',
+        b'Artist:': 'artist',
+        b'Version:': 'version',
+        b'Creator:': 'creator',
+    },
+}
+
+# "(TV Size)" などタイトル中の括弧書きの注記（検索に引っかからない原因になる）
+_TITLE_ANNOTATION_RE = re.compile(r'\s*\([^)]*\)')
+
+# これより小さいファイルはmmapせずに一括で読み込む（mmapの準備コストの方が大きいため）
+_MMAP_THRESHOLD = 4 * 1024
+
+# 一時的な通信エラー（Spotify APIの呼び出しでは再試行の対象にする）
+_NETWORK_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+# Spotify APIの呼び出しで発生しうるエラー
+# （アクセストークンの更新失敗や、再試行しても解消しなかった通信エラーを含む）
+_SPOTIFY_ERRORS = (spotipy.SpotifyException, SpotifyOauthError) + _NETWORK_ERRORS
+
+
+def _scan_osu_lines(lines) -> Optional[Dict[str, str]]:
+    """
+    osuファイルの各行（バイト列）を走査して楽曲情報を抽出する
+    
+    Args:
+        lines: osuファイルの行のイテラブル
+        
+    Returns:
+        楽曲情報の辞書、Metadataセクションがない場合はNone
+    """
+    metadata = {
+        'title': "",
+        'artist': "",
+        'version': "",
+        'creator': "",
+        'audio_filename': ""
+    }
+    needed = {key for fields in _OSU_FIELDS.values() for key in fields.values()}
+    pending_sections = set(_OSU_FIELDS)
+    has_metadata = False
+    section = None
+    fields = None
+    
+    # 1行ずつ走査し、現在のセクションに応じてフィールドを取り出す
+    for line in lines:
+        if line.startswith(b'['):
+            # 対象セクションをすべて読み終えたら、空のフィールドが残っていても終了
+            pending_sections.discard(section)
+            if not pending_sections:
+                break
+            
+            section = line.strip()[1:-1]
+            fields = _OSU_FIELDS.get(section)
+            if section == b'Metadata':
+                has_metadata = True
+            continue
+        
+        if fields is None:
+            continue
+        
+        for prefix, key in fields.items():
+            if line.startswith(prefix):
+                metadata[key] = line[len(prefix):].decode('utf-8', 'replace').strip()
+                needed.discard(key)
+                break
+        
+        # 必要なフィールドがすべて揃ったら残り（HitObjects等）は読まない
+        if not needed:
+            break
+    
+    return metadata if has_metadata else None
+
+
+def parse_osu_file(file_path: str) -> Dict[str, str]:
+    """
+    osuファイルを解析して楽曲情報を抽出する
+    
+    プロセスプールから呼び出せるようにモジュールレベルの関数として定義している。
+    
+    Args:
+        file_path: osuファイルのパス
+        
+    Returns:
+        楽曲情報の辞書
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < _MMAP_THRESHOLD:
+                metadata = _scan_osu_lines(file.read().splitlines())
+            else:
+                # 大きなファイルはmmapし、必要な行までだけをページキャッシュから読む
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    metadata = _scan_osu_lines(iter(mm.readline, b''))
+        
+        if metadata is None:
+            print(f"警告: {file_path} からMetadataセクションが見つかりませんでした")
+            return {}
+        
+        return metadata
+            
+    except Exception as e:
+        print(f"エラー: {file_path} の解析中にエラーが発生しました: {e}")
+        return {}
+
+
+def _parse_osu_file_with_path(file_path: str) -> Tuple[str, Dict[str, str]]:
+    """parse_osu_fileの結果を元のパスと組にして返す（プロセスプール用）"""
+    return file_path, parse_osu_file(file_path)
+
+
+def iter_osu_files(root: str, recursive: bool = True) -> Iterator[str]:
+    """
+    ディレクトリ内の.osuファイルのパスを見つけた順に返す
+    
+    os.scandirのDirEntryが持つ種別情報を使うため、ファイルごとにstatを呼ばない。
+    "."で始まる隠しディレクトリには入らない。
+    
+    Args:
+        root: 検索するディレクトリのパス
+        recursive: サブディレクトリも再帰的に検索するかどうか
+        
+    Yields:
+        .osuファイルのパス
+    """
+    # 再帰呼び出しの代わりに明示的なスタックで走査する
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and name[0] != '.':
+                            stack.append(entry.path)
+                    # 拡張子の判定は1文字の比較で大半（.mp3や.png等）を先に除外する
+                    elif len(name) > 4 and name[-4] == '.' and name.endswith('osu') and entry.is_file():
+                        yield entry.path
+        except (PermissionError, OSError):
+            # アクセスできないディレクトリはスキップ
+            continue
+
+
+class Status(IntEnum):
+    """楽曲をプレイリストに追加した結果"""
+    ADDED = 0       # 新規追加した
+    DUPLICATE = 1   # 既にプレイリストに存在した
+    FAILED = 2      # 解析・検索・追加のいずれかに失敗した
+
+
 class OsuFileParser:
     """osuファイルを解析するクラス"""
     
@@ -35,51 +200,59 @@ class OsuFileParser:
         Returns:
             楽曲情報の辞書
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Metadataセクションを抽出
-            metadata_match = re.search(r'\[Metadata\](.*?)(?=\n\[|\n$)', content, re.DOTALL)
-            if metadata_match:
-                metadata_text = metadata_match.group(1)
-                
-                # 各フィールドを抽出
-                title_match = re.search(r'Title:(.*)', metadata_text)
-                artist_match = re.search(r'Artist:(.*)', metadata_text)
-                version_match = re.search(r'Version:(.*)', metadata_text)
-                creator_match = re.search(r'Creator:(.*)', metadata_text)
-                
-                # GeneralセクションからAudioFilenameを抽出
-                general_match = re.search(r'\[General\](.*?)(?=\n\[|\n$)', content, re.DOTALL)
-                audio_filename = ""
-                if general_match:
-                    audio_match = re.search(r'AudioFilename:(.*)', general_match.group(1))
-                    if audio_match:
-                        audio_filename = audio_match.group(1).strip()
-                
-                self.metadata = {
-                    'title': title_match.group(1).strip() if title_match else "",
-                    'artist': artist_match.group(1).strip() if artist_match else "",
-                    'version': version_match.group(1).strip() if version_match else "",
-                    'creator': creator_match.group(1).strip() if creator_match else "",
-                    'audio_filename': audio_filename
-                }
-                
-                return self.metadata
-            else:
-                print(f"警告: {file_path} からMetadataセクションが見つかりませんでした")
-                return {}
-                
-        except Exception as e:
-            print(f"エラー: {file_path} の解析中にエラーが発生しました: {e}")
-            return {}
+        self.metadata = parse_osu_file(file_path)
+        return self.metadata
+
+
+class RateLimiter:
+    """
+    Spotify APIへのリクエスト頻度を制限するクラス
+    
+    トークンバケット方式で1秒あたりのリクエスト数を一定に保ち、
+    同時に実行中のリクエスト数も制限する。with文で使用する。
+    """
+    
+    def __init__(self, rate: float = 10.0, max_concurrent: int = 2):
+        """
+        Args:
+            rate: 1秒あたりの最大リクエスト数
+            max_concurrent: 同時に実行できるリクエスト数
+        """
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+        self._semaphore = threading.Semaphore(max_concurrent)
+    
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_slot - now)
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait:
+            time.sleep(wait)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
+        return False
 
 
 class SpotifyManager:
     """Spotify APIを管理するクラス"""
     
-    def __init__(self, client_id: str, client_secret: str, redirect_uri: str = "http://127.0.0.1:8888/callback"):
+    # playlist_add_itemsで一度に追加できる楽曲数の上限
+    PLAYLIST_ADD_BATCH_SIZE = 100
+    
+    # 一時的なエラー(429/401/5xx・通信エラー)時の最大再試行回数
+    MAX_RETRIES = 3
+    
+    # HTTP接続プールの大きさ（並列検索のスレッド数より大きくしておく）
+    HTTP_POOL_CONNECTIONS = 16
+    HTTP_POOL_MAXSIZE = 32
+    
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str = "http://127.0.0.1:8888/callback",
+                 search_cache_path: str = ".osu_spotify_search.json"):
         """
         SpotifyManagerの初期化
         
@@ -87,6 +260,7 @@ class SpotifyManager:
             client_id: SpotifyアプリのClient ID
             client_secret: SpotifyアプリのClient Secret
             redirect_uri: リダイレクトURI
+            search_cache_path: 検索結果キャッシュの保存先（削除すればキャッシュを破棄できる）
         """
         self.client_id = client_id
         self.client_secret = client_secret
@@ -108,12 +282,198 @@ class SpotifyManager:
         if not token_info:
             token_info = self.sp_oauth.get_access_token()
         
-        self.sp = spotipy.Spotify(auth=token_info['access_token'])
+        self._token_info = token_info
+        self._auth_lock = threading.Lock()
+        
+        # トークン更新でクライアントを作り直しても、接続（keep-alive）は使い回す
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.HTTP_POOL_CONNECTIONS,
+                                                pool_maxsize=self.HTTP_POOL_MAXSIZE)
+        self._session.mount("https://", adapter)
+        self.sp = self._create_client()
+        
+        # プレイリストID -> 楽曲IDの集合（重複チェック用キャッシュ）
+        self._playlist_cache: Dict[str, set] = {}
+        self._playlist_lock = threading.RLock()
+        
+        # すべてのAPI呼び出しで共有するレート制限
+        self._rate_limiter = RateLimiter()
+        
+        # 正規化した(タイトル, アーティスト名) -> 検索結果（見つからなかった場合はNone）
+        # 前回までの実行結果をディスクから読み込み、終了時（またはclose時）に書き戻す（登録は__init__の最後）
+        self._search_cache_path = Path(search_cache_path)
+        self._search_cache: Dict[Tuple[str, str], Optional[Dict]] = self._load_search_cache()
+        # 検索中のキー -> 検索完了を知らせるEvent（同じ楽曲を複数スレッドで同時に検索しない）
+        self._search_inflight: Dict[Tuple[str, str], threading.Event] = {}
+        self._search_lock = threading.Lock()
+        
+        # プレイリスト名 -> プレイリストID（初期化時に一度だけ全件取得）
+        self._playlists_by_name: Dict[str, str] = {}
+        self._load_user_playlists()
+        
+        # 終了時の保存は初期化がすべて成功してから登録する
+        # （途中で失敗したインスタンスの古いキャッシュで上書きしないため）
+        atexit.register(self.save_search_cache)
+    
+    def set_max_concurrent_requests(self, max_concurrent: int):
+        """
+        同時に実行するAPIリクエスト数の上限を変更する
+        
+        並列に処理するスレッド数に合わせて呼び出す。1秒あたりのリクエスト数の上限は変わらない。
+        APIの呼び出し中には呼び出さないこと。
+        
+        Args:
+            max_concurrent: 同時に実行できるリクエスト数
+        """
+        self._rate_limiter = RateLimiter(rate=1.0 / self._rate_limiter.interval, max_concurrent=max_concurrent)
+    
+    def _create_client(self) -> spotipy.Spotify:
+        """現在のアクセストークンでSpotifyクライアントを作成"""
+        return spotipy.Spotify(auth=self._token_info['access_token'], requests_session=self._session)
+    
+    def _refresh_client(self, failed_client: spotipy.Spotify):
+        """
+        アクセストークンを更新してSpotifyクライアントを作り直す
+        
+        複数のスレッドが同時に401を受け取った場合でも、更新は一度だけ行う。
+        
+        Args:
+            failed_client: 401を返したときに使用していたクライアント
+        """
+        with self._auth_lock:
+            if self.sp is not failed_client:
+                return
+            print("アクセストークンの有効期限が切れたため更新します")
+            self._token_info = self.sp_oauth.refresh_access_token(self._token_info['refresh_token'])
+            self.sp = self._create_client()
+    
+    def _call(self, method_name: str, *args, **kwargs):
+        """
+        レート制限を守りながらSpotify APIを呼び出す
+        
+        一時的なエラーは最大MAX_RETRIES回まで再試行する。
+        - 429(Too Many Requests): Retry-Afterヘッダーの秒数だけ待って再試行
+        - 401(Unauthorized): アクセストークンを更新して再試行
+        - 5xx・タイムアウト・接続失敗: 指数バックオフで待って再試行
+        それ以外のエラーはそのまま呼び出し元に送出する。
+        
+        Args:
+            method_name: 呼び出すspotipy.Spotifyのメソッド名
+            *args, **kwargs: メソッドに渡す引数
+            
+        Returns:
+            メソッドの戻り値
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            client = self.sp
+            with self._rate_limiter:
+                try:
+                    return getattr(client, method_name)(*args, **kwargs)
+                except _NETWORK_ERRORS:
+                    # タイムアウトや接続失敗は一時的なものとして5xxと同様に再試行する
+                    if attempt == self.MAX_RETRIES:
+                        raise
+                    status, headers = None, {}
+                except spotipy.SpotifyException as e:
+                    status = e.http_status
+                    headers = getattr(e, 'headers', None) or {}
+                    if attempt == self.MAX_RETRIES or not (status in (401, 429) or status >= 500):
+                        raise
+            
+            if status == 401:
+                self._refresh_client(client)
+                continue
+            
+            if status == 429:
+                delay = float(headers.get('Retry-After', 1)) + random.uniform(0, 0.5)
+                print(f"レート制限に達しました。{delay:.1f}秒後に再試行します")
+            else:
+                delay = 2 ** attempt + random.uniform(0, 0.5)
+                reason = f"サーバーエラー({status})" if status else "通信エラー"
+                print(f"Spotifyの{reason}。{delay:.1f}秒後に再試行します")
+            time.sleep(delay)
+    
+    @staticmethod
+    def _search_key(title: str, artist: str) -> Tuple[str, str]:
+        """検索キャッシュのキーを作成（大文字小文字と空白の違いを無視）"""
+        return (' '.join(title.casefold().split()), ' '.join(artist.casefold().split()))
+    
+    def _load_search_cache(self) -> Dict[Tuple[str, str], Optional[Dict]]:
+        """ディスクに保存された検索結果キャッシュを読み込む"""
+        if not self._search_cache_path.exists():
+            return {}
+        
+        try:
+            data = json.loads(self._search_cache_path.read_text(encoding='utf-8'))
+            return {tuple(key.split('\n', 1)): track for key, track in data.items()}
+        except (OSError, ValueError) as e:
+            print(f"警告: 検索キャッシュの読み込みに失敗しました: {e}")
+            return {}
+    
+    def save_search_cache(self):
+        """
+        検索結果キャッシュをディスクに保存する
+        
+        ファイルを小さく保つため、楽曲情報は処理に使う項目だけを保存する。
+        """
+        data = {}
+        for (title, artist), track in list(self._search_cache.items()):
+            data[f"{title}\n{artist}"] = {
+                'id': track['id'],
+                'name': track['name'],
+                'artists': [{'name': track['artists'][0]['name']}],
+                'external_urls': {'spotify': track['external_urls']['spotify']}
+            } if track else None
+        
+        try:
+            self._search_cache_path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        except OSError as e:
+            print(f"警告: 検索キャッシュの保存に失敗しました: {e}")
+    
+    def refresh_playlists(self):
+        """
+        プレイリストに関するキャッシュを破棄して取得し直す
+        
+        同じインスタンスで再度処理を行う前に呼ぶ。前回の処理の後にSpotify側で
+        楽曲やプレイリストが削除・変更されていても正しく判定できるようにする。
+        """
+        with self._playlist_lock:
+            self._playlist_cache = {}
+            self._playlists_by_name = {}
+            self._load_user_playlists()
+    
+    def close(self):
+        """
+        検索結果キャッシュを保存し、HTTP接続を閉じる
+        
+        インスタンスを作り直す場合は古い方で呼び出す。終了時の保存処理の登録も解除するため、
+        使われなくなったインスタンスの古いキャッシュで新しい結果が上書きされることはない。
+        """
+        atexit.unregister(self.save_search_cache)
+        self.save_search_cache()
+        self._session.close()
+    
+    def _load_user_playlists(self):
+        """ユーザーのプレイリストをすべて取得し、名前からIDを引けるようにする"""
+        results = self._call('current_user_playlists', limit=50)
+        while results:
+            for playlist in results['items']:
+                # 同名のプレイリストが複数ある場合は先に見つかったものを使う
+                self._playlists_by_name.setdefault(playlist['name'], playlist['id'])
+            
+            if results['next']:
+                results = self._call('next', results)
+            else:
+                break
     
     def search_track(self, title: str, artist: str) -> Optional[Dict]:
         """
         Spotifyで楽曲を検索する
         
+        同じ楽曲の検索結果はキャッシュし、難易度違いのosuファイルなどで
+        同じ楽曲を再度検索する場合はAPIを呼び出さない。
+        複数のスレッドが同時に同じ楽曲を検索した場合も、APIの呼び出しは1回だけ行う。
+        
         Args:
             title: 楽曲タイトル
             artist: アーティスト名
@@ -121,27 +481,83 @@ class SpotifyManager:
         Returns:
             見つかった楽曲の情報、見つからない場合はNone
         """
-        try:
-            # 検索クエリを作成
-            query = f"track:{title} artist:{artist}"
+        key = self._search_key(title, artist)
+        with self._search_lock:
+            if key in self._search_cache:
+                return self._search_cache[key]
             
-            print(f"検索中: {query}")
+            # 他のスレッドが同じ楽曲を検索中なら、その結果を待って使う
+            done = self._search_inflight.get(key)
+            if done is None:
+                self._search_inflight[key] = threading.Event()
+        
+        if done is not None:
+            done.wait()
+            # 検索に失敗した場合はキャッシュされていないのでNoneになる
+            return self._search_cache.get(key)
+        
+        try:
+            track = self._search_first_track(title, artist)
             
-            # Spotifyで検索
-            results = self.sp.search(q=query, type='track', limit=10)
+            # 見つからない場合は "(TV Size)" などの注記を除いたタイトルで再検索
+            if not track:
+                stripped_title = _TITLE_ANNOTATION_RE.sub('', title).strip()
+                if stripped_title and stripped_title != title:
+                    track = self._search_first_track(stripped_title, artist)
             
-            if results['tracks']['items']:
-                # 最初の結果を返す
-                track = results['tracks']['items'][0]
+            if track:
                 print(f"見つかりました: {track['name']} - {track['artists'][0]['name']}")
-                return track
             else:
                 print(f"楽曲が見つかりませんでした: {title} - {artist}")
-                return None
+            
+            self._search_cache[key] = track
+            return track
                 
-        except Exception as e:
+        except _SPOTIFY_ERRORS as e:
             print(f"検索エラー: {e}")
             return None
+        
+        finally:
+            with self._search_lock:
+                self._search_inflight.pop(key).set()
+    
+    def _search_first_track(self, title: str, artist: str) -> Optional[Dict]:
+        """
+        タイトルとアーティスト名で検索し、最も関連度の高い1曲を返す
+        
+        Args:
+            title: 楽曲タイトル
+            artist: アーティスト名
+            
+        Returns:
+            見つかった楽曲の情報、見つからない場合はNone
+        """
+        query = f"track:{title} artist:{artist}"
+        print(f"検索中: {query}")
+        
+        # 使うのは先頭の1件だけなので、それ以上は取得しない
+        results = self._call('search', q=query, type='track', limit=1, market='from_token')
+        items = results['tracks']['items']
+        return items[0] if items else None
+    
+    def search_tracks(self, queries: List[Tuple[str, str]], max_workers: int = 5) -> Dict[Tuple[str, str], Optional[Dict]]:
+        """
+        複数の楽曲を並列にSpotifyで検索する
+        
+        検索はネットワーク待ちが大半なので、スレッドプールで同時に
+        リクエストを投げて待ち時間を重ねる。
+        
+        Args:
+            queries: (タイトル, アーティスト名)のリスト
+            max_workers: 同時に実行する検索リクエスト数の上限
+            
+        Returns:
+            (タイトル, アーティスト名)をキー、search_trackの結果を値とする辞書
+        """
+        unique_queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda query: self.search_track(*query), unique_queries)
+            return dict(zip(unique_queries, results))
     
     def create_playlist(self, name: str, description: str = "") -> Optional[str]:
         """
@@ -155,18 +571,22 @@ class SpotifyManager:
             作成されたプレイリストのID、失敗した場合はNone
         """
         try:
-            user_id = self.sp.current_user()['id']
-            playlist = self.sp.user_playlist_create(
+            user_id = self._call('current_user')['id']
+            playlist = self._call(
+                'user_playlist_create',
                 user=user_id,
                 name=name,
                 public=True,
                 description=description
             )
             
+            self._playlists_by_name[name] = playlist['id']
+            # 作成直後のプレイリストは空なので、重複チェックのために中身を取得する必要はない
+            self._playlist_cache[playlist['id']] = set()
             print(f"プレイリストを作成しました: {name}")
             return playlist['id']
             
-        except Exception as e:
+        except _SPOTIFY_ERRORS as e:
             print(f"プレイリスト作成エラー: {e}")
             return None
     
@@ -178,28 +598,57 @@ class SpotifyManager:
             playlist_id: プレイリストID
             
         Returns:
-            楽曲IDのリスト
+            楽曲IDのリスト（取得に失敗した場合は空のリスト）
         """
         try:
-            tracks = []
-            results = self.sp.playlist_tracks(playlist_id)
+            return self._fetch_playlist_track_ids(playlist_id)
             
-            while results:
-                for item in results['items']:
-                    if item['track'] and item['track']['id']:
-                        tracks.append(item['track']['id'])
-                
-                if results['next']:
-                    results = self.sp.next(results)
-                else:
-                    break
-            
-            return tracks
-            
-        except Exception as e:
+        except _SPOTIFY_ERRORS as e:
             print(f"プレイリスト取得エラー: {e}")
             return []
     
+    def _fetch_playlist_track_ids(self, playlist_id: str) -> List[str]:
+        """プレイリスト内の楽曲IDをすべてのページから取得する（エラーはそのまま送出）"""
+        tracks = []
+        # 必要なのは楽曲IDだけなので、fieldsで応答を絞り込む
+        results = self._call('playlist_tracks', playlist_id, fields='items(track(id)),next', limit=100)
+        
+        while results:
+            for item in results['items']:
+                if item['track'] and item['track']['id']:
+                    tracks.append(item['track']['id'])
+            
+            if results['next']:
+                results = self._call('next', results)
+            else:
+                break
+        
+        return tracks
+    
+    def get_playlist_track_ids(self, playlist_id: str) -> set:
+        """
+        プレイリスト内の楽曲IDの集合を取得する
+        
+        初回のみAPIから取得し、以降はキャッシュした集合を返す。
+        このクラスで追加した楽曲もキャッシュに反映される。
+        取得に失敗した場合はキャッシュせず、例外をそのまま送出する
+        （途中までの結果で重複チェックを行うと既存の楽曲を再度追加してしまうため）。
+        
+        Args:
+            playlist_id: プレイリストID
+            
+        Returns:
+            楽曲IDの集合
+            
+        Raises:
+            _SPOTIFY_ERRORS: プレイリストの取得に失敗した場合
+        """
+        # 複数スレッドから同時に呼ばれても取得は1回だけ行う
+        with self._playlist_lock:
+            if playlist_id not in self._playlist_cache:
+                self._playlist_cache[playlist_id] = set(self._fetch_playlist_track_ids(playlist_id))
+            return self._playlist_cache[playlist_id]
+    
     def is_track_in_playlist(self, playlist_id: str, track_id: str) -> bool:
         """
         楽曲がプレイリストに既に存在するかチェックする
@@ -210,16 +659,14 @@ class SpotifyManager:
             
         Returns:
             存在する場合はTrue、存在しない場合はFalse
-        """
-        try:
-            playlist_tracks = self.get_playlist_tracks(playlist_id)
-            return track_id in playlist_tracks
             
-        except Exception as e:
-            print(f"重複チェックエラー: {e}")
-            return False
+        Raises:
+            _SPOTIFY_ERRORS: プレイリストの取得に失敗し、判定できない場合
+        """
+        # プレイリストの中身は初回のみ取得し、以降はキャッシュした集合で判定する
+        return track_id in self.get_playlist_track_ids(playlist_id)
     
-    def add_track_to_playlist(self, playlist_id: str, track_id: str, check_duplicate: bool = True) -> Tuple[bool, str]:
+    def add_track_to_playlist(self, playlist_id: str, track_id: str, check_duplicate: bool = True) -> Tuple[Status, str]:
         """
         プレイリストに楽曲を追加する
         
@@ -229,18 +676,57 @@ class SpotifyManager:
             check_duplicate: 重複チェックを行うかどうか
             
         Returns:
-            (成功フラグ, メッセージ)のタプル
+            (処理結果, メッセージ)のタプル
         """
+        # 重複チェック（複数スレッドから同じ楽曲を同時に追加しないよう、
+        # チェックと同時にキャッシュへ登録して追加中の楽曲を予約する）
+        if check_duplicate:
+            with self._playlist_lock:
+                try:
+                    exists = self.is_track_in_playlist(playlist_id, track_id)
+                except _SPOTIFY_ERRORS as e:
+                    # 判定できない場合は重複なしとみなさず失敗として扱う
+                    return Status.FAILED, f"重複チェックエラー: {e}"
+                if exists:
+                    return Status.DUPLICATE, "楽曲は既にプレイリストに存在します"
+                self._playlist_cache.setdefault(playlist_id, set()).add(track_id)
+        
         try:
-            # 重複チェック
+            self._call('playlist_add_items', playlist_id, [track_id])
+            if playlist_id in self._playlist_cache:
+                self._playlist_cache[playlist_id].add(track_id)
+            return Status.ADDED, "楽曲をプレイリストに追加しました"
+            
+        except _SPOTIFY_ERRORS as e:
+            # 追加に失敗した楽曲の予約を取り消す
             if check_duplicate:
-                if self.is_track_in_playlist(playlist_id, track_id):
-                    return False, "楽曲は既にプレイリストに存在します"
+                with self._playlist_lock:
+                    self._playlist_cache[playlist_id].discard(track_id)
+            return Status.FAILED, f"楽曲追加エラー: {e}"
+    
+    def add_tracks_to_playlist(self, playlist_id: str, track_ids: List[str]) -> Tuple[bool, str]:
+        """
+        プレイリストに複数の楽曲をまとめて追加する
+        
+        Spotify APIは1リクエストあたり最大100曲まで追加できるため、
+        100曲ずつに分けて送信する。重複チェックは呼び出し側で行うこと。
+        
+        Args:
+            playlist_id: プレイリストID
+            track_ids: 楽曲IDのリスト
             
-            self.sp.playlist_add_items(playlist_id, [track_id])
+        Returns:
+            (成功フラグ, メッセージ)のタプル
+        """
+        try:
+            for i in range(0, len(track_ids), self.PLAYLIST_ADD_BATCH_SIZE):
+                batch = track_ids[i:i + self.PLAYLIST_ADD_BATCH_SIZE]
+                self._call('playlist_add_items', playlist_id, batch)
+                if playlist_id in self._playlist_cache:
+                    self._playlist_cache[playlist_id].update(batch)
             return True, "楽曲をプレイリストに追加しました"
             
-        except Exception as e:
+        except _SPOTIFY_ERRORS as e:
             return False, f"楽曲追加エラー: {e}"
     
     def get_or_create_osu_playlist(self, playlist_name: str = "osu! 楽曲ライブラリ") -> Optional[str]:
@@ -253,24 +739,17 @@ class SpotifyManager:
         Returns:
             プレイリストID
         """
-        try:
-            # 既存のプレイリストを検索
-            playlists = self.sp.current_user_playlists()
-            
-            for playlist in playlists['items']:
-                if playlist['name'] == playlist_name:
-                    print(f"既存のプレイリストを使用: {playlist_name}")
-                    return playlist['id']
-            
-            # プレイリストが存在しない場合は作成
-            return self.create_playlist(
-                playlist_name,
-                "osu!ファイルから抽出した楽曲のライブラリ"
-            )
-            
-        except Exception as e:
-            print(f"プレイリスト取得エラー: {e}")
-            return None
+        # 既存のプレイリストを検索
+        playlist_id = self._playlists_by_name.get(playlist_name)
+        if playlist_id:
+            print(f"既存のプレイリストを使用: {playlist_name}")
+            return playlist_id
+        
+        # プレイリストが存在しない場合は作成
+        return self.create_playlist(
+            playlist_name,
+            "osu!ファイルから抽出した楽曲のライブラリ"
+        )
 
 
 class OsuToLibrary:
@@ -286,11 +765,21 @@ class OsuToLibrary:
         """
         self.parser = OsuFileParser()
         self.spotify = SpotifyManager(spotify_client_id, spotify_client_secret)
-        self.added_tracks = []
-        self.duplicate_tracks = []
-        self.skipped_tracks = []
+        # 処理結果（Spotifyの楽曲ID -> 楽曲情報）
+        # 同じ楽曲に複数回出会っても1件として扱う
+        self.added_tracks: Dict[str, Dict[str, str]] = {}
+        self.duplicate_tracks: Dict[str, Dict[str, str]] = {}
+        self.skipped_tracks: Dict[str, Dict[str, str]] = {}
+        self._results_lock = threading.Lock()
     
-    def process_osu_file(self, osu_file_path: str, playlist_id: str = None, check_duplicate: bool = True) -> Tuple[bool, str]:
+    def reset_results(self):
+        """処理結果の記録を消去する（同じインスタンスで再度処理を行う前に呼ぶ）"""
+        with self._results_lock:
+            self.added_tracks = {}
+            self.duplicate_tracks = {}
+            self.skipped_tracks = {}
+    
+    def process_osu_file(self, osu_file_path: str, playlist_id: str = None, check_duplicate: bool = True) -> Tuple[Status, str]:
         """
         単一のosuファイルを処理する
         
@@ -300,54 +789,101 @@ class OsuToLibrary:
             check_duplicate: 重複チェックを行うかどうか
             
         Returns:
-            (成功フラグ, メッセージ)のタプル
+            (処理結果, メッセージ)のタプル
         """
         print(f"\n処理中: {osu_file_path}")
         
         # osuファイルを解析
         metadata = self.parser.parse_osu_file(osu_file_path)
+        return self.process_metadata(osu_file_path, metadata, playlist_id, check_duplicate)
+    
+    def process_metadata(self, osu_file_path: str, metadata: Dict[str, str], playlist_id: str = None, check_duplicate: bool = True) -> Tuple[Status, str]:
+        """
+        解析済みの楽曲情報をSpotifyで検索し、プレイリストに追加する
+        
+        Args:
+            osu_file_path: 解析元のosuファイルのパス
+            metadata: parse_osu_fileで抽出した楽曲情報
+            playlist_id: プレイリストID（指定しない場合は自動で作成）
+            check_duplicate: 重複チェックを行うかどうか
+            
+        Returns:
+            (処理結果, メッセージ)のタプル
+        """
         if not metadata:
-            return False, "osuファイルの解析に失敗しました"
+            return Status.FAILED, "osuファイルの解析に失敗しました"
         
         print(f"楽曲情報: {metadata['title']} - {metadata['artist']}")
         
         # Spotifyで検索
         track = self.spotify.search_track(metadata['title'], metadata['artist'])
         if not track:
-            return False, f"楽曲が見つかりませんでした: {metadata['title']} - {metadata['artist']}"
+            return Status.FAILED, f"楽曲が見つかりませんでした: {metadata['title']} - {metadata['artist']}"
         
         # プレイリストIDが指定されていない場合は自動で取得/作成
         if not playlist_id:
             playlist_id = self.spotify.get_or_create_osu_playlist()
             if not playlist_id:
-                return False, "プレイリストの取得/作成に失敗しました"
+                return Status.FAILED, "プレイリストの取得/作成に失敗しました"
         
         # プレイリストに追加
-        success, message = self.spotify.add_track_to_playlist(playlist_id, track['id'], check_duplicate)
-        
-        if success:
-            self.added_tracks.append({
-                'title': track['name'],
-                'artist': track['artists'][0]['name'],
-                'spotify_url': track['external_urls']['spotify'],
-                'file_path': osu_file_path
-            })
-        elif "既にプレイリストに存在します" in message:
-            self.duplicate_tracks.append({
-                'title': track['name'],
-                'artist': track['artists'][0]['name'],
-                'spotify_url': track['external_urls']['spotify'],
-                'file_path': osu_file_path
-            })
-        else:
-            self.skipped_tracks.append({
-                'title': track['name'],
-                'artist': track['artists'][0]['name'],
-                'file_path': osu_file_path,
-                'reason': message
-            })
+        status, message = self.spotify.add_track_to_playlist(playlist_id, track['id'], check_duplicate)
         
-        return success, message
+        # 複数スレッドから呼ばれても結果の記録が混ざらないようにする
+        with self._results_lock:
+            if status == Status.ADDED:
+                self.added_tracks[track['id']] = self._track_info(track, osu_file_path)
+            elif status == Status.DUPLICATE:
+                self.duplicate_tracks[track['id']] = self._track_info(track, osu_file_path)
+            else:
+                self.skipped_tracks[track['id']] = self._skipped_info(track, osu_file_path, message)
+        
+        return status, message
+    
+    @staticmethod
+    def _track_info(track: Dict, osu_file_path: str) -> Dict[str, str]:
+        """処理結果として記録する楽曲情報を作成"""
+        return {
+            'title': track['name'],
+            'artist': track['artists'][0]['name'],
+            'spotify_url': track['external_urls']['spotify'],
+            'file_path': osu_file_path
+        }
+    
+    @staticmethod
+    def _skipped_info(track: Dict, osu_file_path: str, reason: str) -> Dict[str, str]:
+        """スキップした楽曲として記録する情報を作成"""
+        return {
+            'title': track['name'],
+            'artist': track['artists'][0]['name'],
+            'file_path': osu_file_path,
+            'reason': reason
+        }
+    
+    def _flush_pending_tracks(self, playlist_id: str, pending: List[Tuple[Dict, str]]) -> int:
+        """
+        追加待ちの楽曲をまとめてプレイリストに追加する
+        
+        Args:
+            playlist_id: プレイリストID
+            pending: (楽曲情報, osuファイルのパス)のリスト
+            
+        Returns:
+            新規追加された楽曲数
+        """
+        if not pending:
+            return 0
+        
+        success, message = self.spotify.add_tracks_to_playlist(playlist_id, [track['id'] for track, _ in pending])
+        print(f"{len(pending)}曲の追加結果: {message}")
+        
+        for track, osu_file_path in pending:
+            if success:
+                self.added_tracks[track['id']] = self._track_info(track, osu_file_path)
+            else:
+                self.skipped_tracks[track['id']] = self._skipped_info(track, osu_file_path, message)
+        
+        return len(pending) if success else 0
     
     def process_directory(self, directory_path: str, playlist_name: str = None, check_duplicate: bool = True, recursive: bool = True) -> int:
         """
@@ -369,30 +905,87 @@ class OsuToLibrary:
         
         # .osuファイルを検索（再帰的または非再帰的）
         if recursive:
-            osu_files = list(directory.rglob("*.osu"))  # 再帰的検索
             print(f"再帰的に検索中: {directory_path}")
         else:
-            osu_files = list(directory.glob("*.osu"))  # 非再帰的検索
             print(f"直接検索中: {directory_path}")
         
-        if not osu_files:
+        # ディレクトリの走査結果をそのままプロセスプールに渡し、見つかった順に解析する
+        # （osuファイルの解析はCPU処理のみなので並列に行う）
+        with ProcessPoolExecutor() as executor:
+            parsed_files = list(executor.map(_parse_osu_file_with_path, iter_osu_files(directory_path, recursive), chunksize=64))
+        
+        if not parsed_files:
             print(f"エラー: {directory_path} に.osuファイルが見つかりません")
             return 0
         
-        print(f"{len(osu_files)}個のosuファイルが見つかりました")
+        print(f"{len(parsed_files)}個のosuファイルが見つかりました")
         
         # プレイリストを取得/作成
-        playlist_id = None
         if playlist_name:
             playlist_id = self.spotify.get_or_create_osu_playlist(playlist_name)
+        else:
+            playlist_id = self.spotify.get_or_create_osu_playlist()
+        if not playlist_id:
+            print("エラー: プレイリストの取得/作成に失敗しました")
+            return 0
+        
+        # 重複チェック用にプレイリストの既存楽曲を取得
+        # （取得できない場合に重複なしとみなすと既存の楽曲を再度追加してしまうため中止する）
+        existing_ids = set()
+        if check_duplicate:
+            try:
+                existing_ids = self.spotify.get_playlist_track_ids(playlist_id)
+            except _SPOTIFY_ERRORS as e:
+                print(f"エラー: プレイリストの既存楽曲を取得できませんでした: {e}")
+                return 0
+        
+        # 難易度違いのosuファイルは同じ楽曲なので、検索前に1つにまとめる
+        parsed = []
+        seen = set()
+        for osu_path, metadata in parsed_files:
+            if metadata:
+                key = (metadata['title'].casefold(), metadata['artist'].casefold())
+                if key in seen:
+                    continue
+                seen.add(key)
+            parsed.append((osu_path, metadata))
+        print(f"重複を除いた楽曲数: {len(seen)}")
         
-        # 各ファイルを処理
+        # Spotifyでの検索はまとめて並列に行う
+        queries = [(metadata['title'], metadata['artist']) for _, metadata in parsed if metadata]
+        search_results = self.spotify.search_tracks(queries)
+        
+        # 重複を除いた楽曲を貯めておき、100曲ごとにまとめてプレイリストへ追加
         added_count = 0
-        for osu_file in osu_files:
-            success, message = self.process_osu_file(str(osu_file), playlist_id, check_duplicate)
-            if success:
-                added_count += 1
-            print(f"結果: {message}")
+        pending: List[Tuple[Dict, str]] = []
+        pending_ids = set()
+        for osu_path, metadata in parsed:
+            print(f"\n処理中: {osu_path}")
+            if not metadata:
+                print("結果: osuファイルの解析に失敗しました")
+                continue
+            
+            print(f"楽曲情報: {metadata['title']} - {metadata['artist']}")
+            track = search_results.get((metadata['title'], metadata['artist']))
+            if not track:
+                print(f"結果: 楽曲が見つかりませんでした: {metadata['title']} - {metadata['artist']}")
+                continue
+            
+            if check_duplicate and (track['id'] in pending_ids or track['id'] in existing_ids):
+                self.duplicate_tracks[track['id']] = self._track_info(track, osu_path)
+                print("結果: 楽曲は既にプレイリストに存在します")
+                continue
+            
+            pending.append((track, osu_path))
+            pending_ids.add(track['id'])
+            print("結果: 追加待ちに登録しました")
+            
+            if len(pending) >= SpotifyManager.PLAYLIST_ADD_BATCH_SIZE:
+                added_count += self._flush_pending_tracks(playlist_id, pending)
+                pending = []
+                pending_ids.clear()
+        
+        added_count += self._flush_pending_tracks(playlist_id, pending)
         
         return added_count
     
@@ -405,18 +998,18 @@ class OsuToLibrary:
         
         if self.added_tracks:
             print("\n新規追加された楽曲:")
-            for track in self.added_tracks:
+            for track in self.added_tracks.values():
                 print(f"  ✓ {track['title']} - {track['artist']}")
                 print(f"    Spotify: {track['spotify_url']}")
         
         if self.duplicate_tracks:
             print("\n重複でスキップされた楽曲:")
-            for track in self.duplicate_tracks:
+            for track in self.duplicate_tracks.values():
                 print(f"  ⚠ {track['title']} - {track['artist']} (既に存在)")
         
         if self.skipped_tracks:
             print("\nその他の理由でスキップされた楽曲:")
-            for track in self.skipped_tracks:
+            for track in self.skipped_tracks.values():
                 print(f"  ✗ {track['title']} - {track['artist']}")
                 print(f"    理由: {track['reason']}")
 
@@ -501,9 +1094,11 @@ def main():
     
     if path.is_file() and path.suffix == '.osu':
         # 単一ファイルの処理
-        success = converter.process_osu_file(args.path)
-        if success:
+        status, _ = converter.process_osu_file(args.path)
+        if status == Status.ADDED:
             print("楽曲を正常に追加しました")
+        elif status == Status.DUPLICATE:
+            print("楽曲は既にプレイリストに存在します")
         else:
             print("楽曲の追加に失敗しました")
     
@@ -9,10 +9,30 @@ OsuToLibrary GUI - osuファイルからSpotifyライブラリに楽曲を追加
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
-import json
+import queue
 import os
+import stat
+import string
+from collections import deque
 from pathlib import Path
-from OsuToLibrary import OsuToLibrary, OsuFileParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from OsuToLibrary import OsuToLibrary, OsuFileParser, Status, iter_osu_files
+
+# 設定ファイルの読み書き（orjsonがあれば高速な方を使う）
+try:
+    import orjson
+    
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    
+    _loads = orjson.loads
+except ImportError:
+    import json
+    
+    def _dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+    
+    _loads = json.loads
 
 # Windowsレジストリアクセスのためのインポート
 try:
@@ -25,20 +45,59 @@ except ImportError:
 class OsuToLibraryGUI:
     """GUIメインクラス"""
     
+    # ステータス・進捗・ログ表示の更新間隔（ミリ秒）とログの最大行数
+    UI_TICK_INTERVAL_MS = 33
+    LOG_MAX_LINES = 5000
+    
+    # 階層検索で中に入らないディレクトリ名（小文字）
+    _SKIP_DIRS = {
+        "windows", "program files", "program files (x86)", "programdata",
+        "$recycle.bin", "system volume information", "node_modules",
+        ".git", ".cache", "appdata",
+    }
+    
+    # 階層検索で1つの起点から走査するディレクトリ数の上限
+    SEARCH_DIR_BUDGET = 5000
+    
+    # 階層検索で中に入らないファイル属性（Windowsの隠し・システムフォルダ）
+    # 定数自体はどのOSにもあるため、st_file_attributesが使えるWindowsでのみ有効にする
+    _SKIP_ATTRIBUTES = (stat.FILE_ATTRIBUTE_HIDDEN | stat.FILE_ATTRIBUTE_SYSTEM) if os.name == "nt" else 0
+    
     def __init__(self, root):
         self.root = root
         self.root.title("OsuToLibrary - osuファイルからSpotifyライブラリへ")
         self.root.geometry("800x600")
         self.root.resizable(True, True)
         
-        # 設定の読み込み
+        # 設定の読み込み（最後に書き込んだ内容を覚えておき、変更がなければ保存しない）
+        # 読み込みに失敗した場合は、ユーザーが保存するまで設定ファイルを自動で上書きしない
+        self._saved_config_bytes = None
+        self._config_load_failed = False
         self.config = self.load_config()
         
-        # OsuToLibraryインスタンス
+        # OsuToLibraryインスタンス（認証情報が変わらない限り処理をまたいで使い回す）
         self.converter = None
+        self._last_creds = None
+        
+        # 検出済みのosu Songsフォルダ（セッション中は再検索しない）
+        self._songs_dir_cache = None
+        
+        # レジストリの検索結果（セッション中は再読み込みしない）
+        self._registry_songs_path = None
+        self._registry_searched = False
+        
+        # 停止ボタンが押されたことを処理スレッドに伝える
+        self._stop_event = threading.Event()
+        
+        # ステータス・進捗・ログは貯めておき、定期的にまとめて表示する
+        self._pending_status = None
+        self._pending_progress = None
+        self._log_buf = []
+        self._ui_lock = threading.Lock()
         
         # GUIコンポーネントの作成
         self.create_widgets()
+        self.root.after(self.UI_TICK_INTERVAL_MS, self._tick)
         
         # デフォルトパスの設定
         self.set_default_osu_path()
@@ -49,68 +108,124 @@ class OsuToLibraryGUI:
     def load_config(self):
         """設定ファイルを読み込む"""
         try:
-            with open("config.json", 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open("config.json", 'rb') as f:
+                data = f.read()
+            self._saved_config_bytes = data
+            return _loads(data)
         except FileNotFoundError:
             return {"spotify_client_id": "", "spotify_client_secret": ""}
         except Exception as e:
+            self._config_load_failed = True
             messagebox.showerror("設定エラー", f"設定ファイルの読み込みに失敗しました: {e}")
             return {"spotify_client_id": "", "spotify_client_secret": ""}
     
-    def save_config(self):
-        """設定ファイルを保存する"""
+    def save_config(self, silent=False):
+        """
+        設定ファイルを保存する
+        
+        Args:
+            silent: Trueの場合は失敗してもダイアログを表示せずログにだけ出力する
+        """
         try:
-            with open("config.json", 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            data = _dumps(self.config)
+            if data == self._saved_config_bytes:
+                return True
+            with open("config.json", 'wb') as f:
+                f.write(data)
+            self._saved_config_bytes = data
+            self._config_load_failed = False
             return True
         except Exception as e:
-            messagebox.showerror("保存エラー", f"設定ファイルの保存に失敗しました: {e}")
+            if silent:
+                self.log(f"設定ファイルの保存に失敗しました: {e}")
+            else:
+                messagebox.showerror("保存エラー", f"設定ファイルの保存に失敗しました: {e}")
             return False
     
     def find_osu_from_registry(self):
-        """レジストリからosuのインストールパスを検索"""
+        """
+        レジストリからosuのインストールパスを検索
+        
+        結果はキャッシュし、見つかったパスが存在しなくなった場合のみ再検索する。
+        """
+        if self._registry_searched and (self._registry_songs_path is None or os.path.isdir(self._registry_songs_path)):
+            return self._registry_songs_path
+        
+        self._registry_songs_path = self._read_osu_registry()
+        self._registry_searched = True
+        return self._registry_songs_path
+    
+    def _read_osu_registry(self):
+        """レジストリのosu関連キーを読み、Songsフォルダのパスを返す"""
         if not WINDOWS_REGISTRY_AVAILABLE:
             return None
         
+        def _songs_from(install_dir):
+            """インストールフォルダ内のSongsフォルダのパス（存在しない場合はNone）"""
+            songs_path = os.path.join(install_dir, "Songs")
+            return songs_path if os.path.isdir(songs_path) else None
+        
+        # (ルートキー, サブキー, 読み取る値の名前)
+        # コマンドのキーは既定値にosu!.exeのパス、アンインストール情報のキーはInstallLocationを持つ
         registry_paths = [
-            (winreg.HKEY_CURRENT_USER, r"Software\Classes\osu\shell\open\command"),
-            (winreg.HKEY_LOCAL_MACHINE, r"Software\Classes\osu\shell\open\command"),
-            (winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Uninstall\osu!"),
-            (winreg.HKEY_LOCAL_MACHINE, r"Software\Microsoft\Windows\CurrentVersion\Uninstall\osu!"),
+            (winreg.HKEY_CURRENT_USER, r"Software\Classes\osu\shell\open\command", ""),
+            (winreg.HKEY_LOCAL_MACHINE, r"Software\Classes\osu\shell\open\command", ""),
+            (winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Uninstall\osu!", "InstallLocation"),
+            (winreg.HKEY_LOCAL_MACHINE, r"Software\Microsoft\Windows\CurrentVersion\Uninstall\osu!", "InstallLocation"),
         ]
         
-        for hkey, subkey in registry_paths:
+        for hkey, subkey, value_name in registry_paths:
             try:
                 with winreg.OpenKey(hkey, subkey) as key:
-                    # インストールパスを取得
-                    try:
-                        install_path, _ = winreg.QueryValueEx(key, "InstallLocation")
-                        if install_path and os.path.exists(install_path):
-                            songs_path = os.path.join(install_path, "Songs")
-                            if os.path.exists(songs_path):
-                                return songs_path
-                    except FileNotFoundError:
-                        pass
-                    
-                    # コマンドラインからパスを抽出
-                    try:
-                        command, _ = winreg.QueryValueEx(key, "")
-                        if command and "osu!.exe" in command:
-                            # "C:\path\to\osu!.exe" から "C:\path\to\" を抽出
-                            exe_path = command.split('"')[1] if '"' in command else command.split()[0]
-                            install_dir = os.path.dirname(exe_path)
-                            songs_path = os.path.join(install_dir, "Songs")
-                            if os.path.exists(songs_path):
-                                return songs_path
-                    except FileNotFoundError:
-                        pass
-            except (FileNotFoundError, OSError):
+                    value, _ = winreg.QueryValueEx(key, value_name)
+            except OSError:
+                continue
+            
+            if not value:
+                continue
+            
+            if value_name == "InstallLocation":
+                # インストールパスをそのまま使う
+                install_dir = value
+            elif "osu!.exe" in value:
+                # "C:\path\to\osu!.exe" から "C:\path\to\" を抽出
+                exe_path = value.split('"')[1] if '"' in value else value.split()[0]
+                install_dir = os.path.dirname(exe_path)
+            else:
                 continue
+            
+            songs_path = _songs_from(install_dir)
+            if songs_path:
+                return songs_path
         
         return None
     
     def find_osu_songs_directory(self):
         """osuのSongsディレクトリを検索"""
+        # このセッションで既に見つかっている場合はそれを使う
+        if self._songs_dir_cache and os.path.isdir(self._songs_dir_cache):
+            return self._songs_dir_cache
+        
+        # 前回見つけたパスが設定に保存されていて、まだ存在する場合はそれを使う
+        saved_path = self.config.get("osu_songs_path")
+        if saved_path and os.path.isdir(saved_path):
+            self._songs_dir_cache = saved_path
+            return saved_path
+        
+        songs_path = self._search_osu_songs_directory()
+        if songs_path:
+            # 次回起動時に再検索しないよう設定に保存
+            self._songs_dir_cache = songs_path
+            self.config["osu_songs_path"] = songs_path
+            if self._config_load_failed:
+                # 読み込めなかった設定ファイルを空の認証情報で上書きしないよう保存しない
+                self.log("設定ファイルを読み込めなかったため、Songsフォルダのパスは保存しません")
+            else:
+                self.save_config(silent=True)
+        return songs_path
+    
+    def _search_osu_songs_directory(self):
+        """osuのSongsディレクトリをレジストリ・既知のパス・階層検索の順で探す"""
         # まずレジストリから検索
         registry_path = self.find_osu_from_registry()
         if registry_path:
@@ -138,7 +253,7 @@ class OsuToLibraryGUI:
         
         # まず直接のパスをチェック
         for path in possible_paths:
-            if os.path.exists(path):
+            if os.path.isdir(path):
                 return path
         
         # 直接見つからない場合は階層検索を実行
@@ -146,63 +261,108 @@ class OsuToLibraryGUI:
     
     def find_osu_songs_recursive(self, max_depth=3):
         """osuのSongsディレクトリを階層的に検索"""
-        # 検索対象のベースディレクトリ
-        base_dirs = [
-            os.path.expanduser("~"),  # ユーザーホームディレクトリ
-            "C:\\",  # Cドライブルート
-            "D:\\",  # Dドライブルート
-        ]
-        
-        # 追加のドライブがあるかチェック
-        import string
-        for drive_letter in string.ascii_uppercase[2:]:  # C, D以降のドライブ
-            drive_path = f"{drive_letter}:\\"
-            if os.path.exists(drive_path):
-                base_dirs.append(drive_path)
+        # 検索対象のベースディレクトリ（ユーザーホームディレクトリと各ドライブのルート）
+        base_dirs = []
+        home_dir = os.path.expanduser("~")
+        if os.path.isdir(home_dir):
+            base_dirs.append(home_dir)
+        base_dirs.extend(self._present_drives())
+        if not base_dirs:
+            return None
         
-        for base_dir in base_dirs:
-            if not os.path.exists(base_dir):
-                continue
-                
-            self.log(f"階層検索中: {base_dir} (最大深度: {max_depth})")
-            result = self.search_songs_directory_recursive(base_dir, max_depth)
-            if result:
-                return result
+        # ドライブごとに独立したI/Oなので並列に検索し、最初に見つかった結果を使う
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(base_dirs))
+        try:
+            futures = []
+            for base_dir in base_dirs:
+                self.log(f"階層検索中: {base_dir} (最大深度: {max_depth})")
+                futures.append(executor.submit(self.search_songs_directory_recursive, base_dir, max_depth, stop_event=stop_event))
+            
+            for future in as_completed(futures):
+                result = future.result()
+                if result:
+                    # 検索スレッドからはTkに触れないため、ログはここ（メインスレッド）で出す
+                    self.log(f"階層検索で発見: {result}")
+                    return result
+        finally:
+            # 見つかった時点で他のドライブの検索を打ち切り、完了は待たない
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
         
         return None
     
-    def search_songs_directory_recursive(self, directory, max_depth, current_depth=0):
-        """指定ディレクトリからosuのSongsフォルダを再帰的に検索"""
-        if current_depth >= max_depth:
-            return None
+    def _present_drives(self):
+        """
+        接続されているC以降のドライブのルートを返す
         
+        Windowsでは GetLogicalDrives のビットマスクを1回読むだけで済ませ、
+        切断されたネットワークドライブへの問い合わせで待たされないようにする。
+        """
         try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                
-                # ディレクトリの場合
-                if os.path.isdir(item_path):
-                    # "osu!" フォルダが見つかった場合、その中にSongsフォルダがあるかチェック
-                    if item.lower() == "osu!":
-                        songs_path = os.path.join(item_path, "Songs")
-                        if os.path.exists(songs_path):
-                            self.log(f"階層検索で発見: {songs_path}")
-                            return songs_path
-                    
-                    # 再帰的に検索（アクセス権限がないディレクトリはスキップ）
-                    try:
-                        result = self.search_songs_directory_recursive(item_path, max_depth, current_depth + 1)
-                        if result:
-                            return result
-                    except (PermissionError, OSError):
-                        continue  # アクセス権限がない場合はスキップ
-        
-        except (PermissionError, OSError):
-            # ディレクトリアクセス権限がない場合はスキップ
-            pass
+            import ctypes
+            mask = ctypes.windll.kernel32.GetLogicalDrives()
+        except (ImportError, AttributeError, OSError):
+            # Windows以外ではドライブ文字を1つずつ確認する
+            return [f"{letter}:\\" for letter in string.ascii_uppercase[2:] if os.path.isdir(f"{letter}:\\")]
+        
+        return [f"{letter}:\\" for i, letter in enumerate(string.ascii_uppercase) if i >= 2 and mask & (1 << i)]
+    
+    def search_songs_directory_recursive(self, directory, max_depth, stop_event=None):
+        """
+        指定ディレクトリからosuのSongsフォルダを階層検索
+        
+        浅い階層から順に（幅優先で）調べ、走査するディレクトリ数をSEARCH_DIR_BUDGETまでに制限する。
+        stop_eventがセットされた時点で検索を打ち切りNoneを返す。
+        """
+        pending = deque([(directory, 0)])
+        visited = 0
+        
+        while pending and visited < self.SEARCH_DIR_BUDGET:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            
+            current, depth = pending.popleft()
+            visited += 1
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if stop_event is not None and stop_event.is_set():
+                            return None
+                        
+                        # ディレクトリ以外は無視（DirEntryのキャッシュ済み情報を使うのでstatは発生しない）
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                        
+                        # "osu!" フォルダが見つかった場合、その中にSongsフォルダがあるかチェック
+                        if entry.name.lower() == "osu!":
+                            songs_path = os.path.join(entry.path, "Songs")
+                            if os.path.isdir(songs_path):
+                                return songs_path
+                        
+                        # osuと無関係なことが分かっているディレクトリには入らない
+                        if entry.name.lower() in self._SKIP_DIRS or self._is_hidden_or_system(entry):
+                            continue
+                        
+                        if depth + 1 < max_depth:
+                            pending.append((entry.path, depth + 1))
+            
+            except (PermissionError, OSError):
+                # ディレクトリアクセス権限がない場合はスキップ
+                continue
         
         return None
     
+    def _is_hidden_or_system(self, entry):
+        """ディレクトリが隠し属性またはシステム属性を持つか（Windowsのみ判定）"""
+        if not self._SKIP_ATTRIBUTES:
+            return False
+        try:
+            attributes = entry.stat(follow_symlinks=False).st_file_attributes
+        except (AttributeError, OSError):
+            return False
+        return bool(attributes & self._SKIP_ATTRIBUTES)
+    
     def set_default_osu_path(self):
         """デフォルトのosuパスを設定"""
         # パスが空で、ディレクトリ選択モードの場合のみ設定
@@ -322,6 +482,12 @@ class OsuToLibraryGUI:
             variable=self.recursive_search_var
         )
         recursive_check.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        # 並列処理数
+        ttk.Label(playlist_frame, text="並列処理数:").grid(row=2, column=0, sticky=tk.W, padx=(0, 5), pady=(5, 0))
+        self.max_workers_var = tk.IntVar(value=8)
+        max_workers_spinbox = ttk.Spinbox(playlist_frame, from_=1, to=16, textvariable=self.max_workers_var, width=5)
+        max_workers_spinbox.grid(row=2, column=1, sticky=tk.W, pady=(5, 0))
     
     def create_action_section(self, parent, row):
         """実行ボタンセクションを作成"""
@@ -439,6 +605,14 @@ class OsuToLibraryGUI:
             messagebox.showerror("ファイルエラー", "osuファイルを選択してください")
             return False
         
+        try:
+            max_workers = self.max_workers_var.get()
+        except tk.TclError:
+            max_workers = 0
+        if max_workers < 1:
+            messagebox.showerror("設定エラー", "並列処理数には1以上の整数を入力してください")
+            return False
+        
         return True
     
     def start_processing(self):
@@ -454,100 +628,110 @@ class OsuToLibraryGUI:
         # UI状態を更新
         self.run_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
-        self.progress_var.set(0)
+        self.set_progress(0)
         self.log_text.delete(1.0, tk.END)
         
-        # 別スレッドで処理を実行
+        # 別スレッドで処理を実行（停止要求は処理ごとに新しいEventで伝える）
+        self._stop_event = threading.Event()
         self.processing_thread = threading.Thread(target=self.process_files)
         self.processing_thread.daemon = True
         self.processing_thread.start()
     
     def stop_processing(self):
         """処理を停止"""
-        self.run_btn.config(state="normal")
+        self._stop_event.set()
+        # 処理開始ボタンは処理スレッドが実際に終了した時点で有効に戻す
         self.stop_btn.config(state="disabled")
-        self.status_var.set("処理が停止されました")
-        self.log("処理を停止しました")
+        self.set_status("停止中...")
+        self.log("処理を停止しています...")
     
     def process_files(self):
         """ファイル処理（別スレッドで実行）"""
         try:
-            # OsuToLibraryインスタンスを作成
-            self.converter = OsuToLibrary(
-                self.client_id_var.get(),
-                self.client_secret_var.get()
-            )
+            # 設定値は処理開始時にまとめて読み取り、以降はローカル変数を使う
+            # （Tkの変数の読み取りは毎回Tclを経由するため）
+            client_id = self.client_id_var.get()
+            client_secret = self.client_secret_var.get()
+            playlist_name = self.playlist_name_var.get()
+            recursive = self.recursive_search_var.get()
+            is_file = self.selection_type.get() == "file"
+            max_workers = self.max_workers_var.get()
+            root_path = Path(self.path_var.get())
+            stop_event = self._stop_event
+            
+            # 前回と同じ認証情報ならOsuToLibraryインスタンスを使い回す
+            # （トークンの再取得やHTTP接続の張り直しを避ける）
+            # プレイリストの情報は前回の処理以降に変わっている可能性があるので取得し直す
+            if self.converter is not None and self._last_creds == (client_id, client_secret):
+                self.converter.reset_results()
+                self.converter.spotify.refresh_playlists()
+            else:
+                if self.converter is not None:
+                    self.converter.spotify.close()
+                    self.converter = None
+                self.converter = OsuToLibrary(client_id, client_secret)
+                self._last_creds = (client_id, client_secret)
+            
+            # 並列処理数だけSpotifyへのリクエストを同時に実行できるようにする
+            # （1秒あたりのリクエスト数の上限はそのまま）
+            self.converter.spotify.set_max_concurrent_requests(max_workers)
             
-            path = Path(self.path_var.get())
+            # プレイリストは処理全体で共通なので最初に一度だけ取得/作成する
+            playlist_id = self.converter.spotify.get_or_create_osu_playlist(playlist_name)
+            if not playlist_id:
+                self.set_status("処理失敗")
+                self.log("プレイリストの取得/作成に失敗しました")
+                messagebox.showerror("エラー", "プレイリストの取得/作成に失敗しました")
+                return
             
-            if self.selection_type.get() == "file":
+            if is_file:
                 # 単一ファイルの処理
-                self.status_var.set("ファイルを処理中...")
-                self.log(f"処理開始: {path.name}")
+                self.set_status("ファイルを処理中...")
+                self.log(f"処理開始: {root_path.name}")
                 
-                success, message = self.converter.process_osu_file(str(path), check_duplicate=True)
+                status, message = self.converter.process_osu_file(str(root_path), playlist_id, check_duplicate=True)
                 
-                self.progress_var.set(100)
-                if success:
-                    self.status_var.set("処理完了")
+                self.set_progress(100)
+                if status == Status.ADDED:
+                    self.set_status("処理完了")
                     self.log("楽曲を正常に追加しました")
                     messagebox.showinfo("完了", "楽曲を正常に追加しました")
-                elif "既にプレイリストに存在します" in message:
-                    self.status_var.set("処理完了")
+                elif status == Status.DUPLICATE:
+                    self.set_status("処理完了")
                     self.log("楽曲は既にプレイリストに存在します")
                     messagebox.showinfo("完了", "楽曲は既にプレイリストに存在します")
                 else:
-                    self.status_var.set("処理失敗")
+                    self.set_status("処理失敗")
                     self.log(f"楽曲の追加に失敗しました: {message}")
                     messagebox.showerror("エラー", f"楽曲の追加に失敗しました:\n{message}")
             
             else:
                 # ディレクトリの処理
-                self.status_var.set("ディレクトリを処理中...")
-                self.log(f"ディレクトリ処理開始: {path}")
+                self.set_status("ディレクトリを処理中...")
+                self.log(f"ディレクトリ処理開始: {root_path}")
                 
                 # .osuファイルを検索（再帰的または非再帰的）
-                if self.recursive_search_var.get():
-                    osu_files = list(path.rglob("*.osu"))  # 再帰的検索
-                    self.log(f"再帰的に検索中: {path}")
+                if recursive:
+                    self.log(f"再帰的に検索中: {root_path}")
                 else:
-                    osu_files = list(path.glob("*.osu"))  # 非再帰的検索
-                    self.log(f"直接検索中: {path}")
+                    self.log(f"直接検索中: {root_path}")
+                processed_count, done_count, total_count = self._process_directory_files(
+                    str(root_path), recursive, playlist_id, max_workers, stop_event)
                 
-                if not osu_files:
-                    self.status_var.set("処理完了")
+                # 停止した場合は途中までの件数を報告する（完了や「見つからない」扱いにはしない）
+                stopped = stop_event.is_set()
+                if total_count == 0 and not stopped:
+                    self.set_status("処理完了")
                     self.log("osuファイルが見つかりませんでした")
                     messagebox.showinfo("完了", "osuファイルが見つかりませんでした")
                     return
                 
-                self.log(f"{len(osu_files)}個のosuファイルが見つかりました")
-                
-                # 各ファイルを処理
-                processed_count = 0
-                for i, osu_file in enumerate(osu_files):
-                    self.status_var.set(f"処理中: {osu_file.name} ({i+1}/{len(osu_files)})")
-                    self.log(f"処理中: {osu_file.name}")
-                    
-                    success, message = self.converter.process_osu_file(
-                        str(osu_file),
-                        self.converter.spotify.get_or_create_osu_playlist(self.playlist_name_var.get()),
-                        check_duplicate=True
-                    )
-                    
-                    if success:
-                        processed_count += 1
-                        self.log(f"✓ {osu_file.name} を正常に追加")
-                    elif "既にプレイリストに存在します" in message:
-                        self.log(f"⚠ {osu_file.name} は既にプレイリストに存在します（スキップ）")
-                    else:
-                        self.log(f"✗ {osu_file.name} の追加に失敗: {message}")
-                    
-                    # 進捗を更新
-                    progress = ((i + 1) / len(osu_files)) * 100
-                    self.progress_var.set(progress)
-                
-                self.status_var.set("処理完了")
-                self.log(f"\n処理完了: {processed_count}/{len(osu_files)}個の楽曲を新規追加しました")
+                if stopped:
+                    self.set_status("処理が停止されました")
+                    self.log(f"\n停止までに{done_count}/{total_count}個のosuファイルを処理し、{processed_count}個の楽曲を新規追加しました")
+                else:
+                    self.set_status("処理完了")
+                    self.log(f"\n処理完了: {processed_count}/{total_count}個の楽曲を新規追加しました")
                 
                 # 詳細な結果を表示
                 self.log(f"\n=== 処理結果詳細 ===")
@@ -557,26 +741,26 @@ class OsuToLibraryGUI:
                 
                 if self.converter.added_tracks:
                     self.log("\n新規追加された楽曲:")
-                    for track in self.converter.added_tracks:
+                    for track in self.converter.added_tracks.values():
                         self.log(f"  ✓ {track['title']} - {track['artist']}")
                         self.log(f"    Spotify: {track['spotify_url']}")
                 
                 if self.converter.duplicate_tracks:
                     self.log("\n重複でスキップされた楽曲:")
-                    for track in self.converter.duplicate_tracks:
+                    for track in self.converter.duplicate_tracks.values():
                         self.log(f"  ⚠ {track['title']} - {track['artist']} (既に存在)")
                 
                 if self.converter.skipped_tracks:
                     self.log("\nその他の理由でスキップされた楽曲:")
-                    for track in self.converter.skipped_tracks:
+                    for track in self.converter.skipped_tracks.values():
                         self.log(f"  ✗ {track['title']} - {track['artist']}")
                         self.log(f"    理由: {track['reason']}")
                 
                 # 完了メッセージ
                 total_processed = len(self.converter.added_tracks) + len(self.converter.duplicate_tracks) + len(self.converter.skipped_tracks)
                 messagebox.showinfo(
-                    "処理完了", 
-                    f"処理完了!\n\n"
+                    "処理停止" if stopped else "処理完了",
+                    ("処理を停止しました\n\n" if stopped else "処理完了!\n\n") +
                     f"新規追加: {len(self.converter.added_tracks)}曲\n"
                     f"重複スキップ: {len(self.converter.duplicate_tracks)}曲\n"
                     f"その他スキップ: {len(self.converter.skipped_tracks)}曲\n"
@@ -584,23 +768,169 @@ class OsuToLibraryGUI:
                 )
         
         except Exception as e:
-            self.status_var.set("エラー発生")
+            self.set_status("エラー発生")
             self.log(f"エラー: {e}")
             messagebox.showerror("エラー", f"処理中にエラーが発生しました:\n{e}")
         
         finally:
+            # 検索結果は処理ごとに保存しておく（アプリの終了を待たない）
+            if self.converter is not None:
+                self.converter.spotify.save_search_cache()
+            
             # UI状態をリセット
+            if self._stop_event.is_set():
+                self.set_status("処理が停止されました")
+                self.log("処理を停止しました")
             self.run_btn.config(state="normal")
             self.stop_btn.config(state="disabled")
     
+    def _process_directory_files(self, root, recursive, playlist_id, max_workers, stop_event):
+        """
+        ディレクトリ内の.osuファイルを見つけた順に並列処理する
+        
+        ディレクトリの走査結果をサイズ制限付きのキューで処理スレッドに流し込むため、
+        全ファイルの列挙を待たずに処理を開始でき、走査が処理を追い越しすぎることもない。
+        総数は走査が終わるまで分からないため、それまで進捗バーは不確定表示にする。
+        
+        Args:
+            root: 処理するディレクトリのパス
+            recursive: サブディレクトリも再帰的に検索するかどうか
+            playlist_id: 追加先のプレイリストID
+            max_workers: 並列に処理するスレッド数
+            stop_event: 停止要求を受け取るEvent
+            
+        Returns:
+            (新規追加した楽曲数, 処理したosuファイル数, 処理対象にしたosuファイル数)のタプル
+        """
+        work_queue = queue.Queue(maxsize=max_workers * 2)
+        counts_lock = threading.Lock()
+        counts = {"done": 0, "added": 0, "total": None}
+        
+        def worker():
+            while True:
+                osu_file = work_queue.get()
+                if osu_file is None:
+                    return
+                if stop_event.is_set():
+                    # 停止要求後は残りのファイルを読み捨てる
+                    continue
+                
+                file_name = os.path.basename(osu_file)
+                try:
+                    status, message = self.converter.process_osu_file(osu_file, playlist_id, check_duplicate=True)
+                except Exception as e:
+                    status, message = Status.FAILED, str(e)
+                
+                if status == Status.ADDED:
+                    self.log(f"✓ {file_name} を正常に追加")
+                elif status == Status.DUPLICATE:
+                    self.log(f"⚠ {file_name} は既にプレイリストに存在します（スキップ）")
+                else:
+                    self.log(f"✗ {file_name} の追加に失敗: {message}")
+                
+                with counts_lock:
+                    counts["done"] += 1
+                    if status == Status.ADDED:
+                        counts["added"] += 1
+                    done, total = counts["done"], counts["total"]
+                
+                # 進捗を更新
+                if total:
+                    self.set_status(f"処理済み: {file_name} ({done}/{total})")
+                    self.set_progress(done / total * 100)
+                else:
+                    self.set_status(f"処理済み: {file_name} ({done}件目)")
+        
+        # 重複チェック用にプレイリストの既存楽曲を先に取得しておく
+        # （処理スレッドが最初の1曲で取得を待たされないようにする）
+        existing_ids = self.converter.spotify.get_playlist_track_ids(playlist_id)
+        self.log(f"プレイリスト内の既存楽曲数: {len(existing_ids)}")
+        
+        self._set_progress_indeterminate(True)
+        total_count = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            workers = [executor.submit(worker) for _ in range(max_workers)]
+            try:
+                for osu_file in iter_osu_files(root, recursive):
+                    if stop_event.is_set():
+                        self.log("停止要求により残りのファイルをキャンセルしました")
+                        break
+                    work_queue.put(osu_file)
+                    total_count += 1
+            finally:
+                for _ in workers:
+                    work_queue.put(None)
+            
+            # 走査が終わって総数が分かったら進捗バーを通常表示に戻す
+            if stop_event.is_set():
+                self.log(f"停止までに{total_count}個のosuファイルを処理対象にしました")
+            else:
+                self.log(f"{total_count}個のosuファイルが見つかりました")
+            with counts_lock:
+                counts["total"] = total_count
+                done = counts["done"]
+            self._set_progress_indeterminate(False)
+            if total_count:
+                self.set_progress(done / total_count * 100)
+        
+        # ワーカーの終了を待ってから件数を返す（停止後に読み捨てたファイルは処理数に含まない）
+        return counts["added"], counts["done"], total_count
+    
+    def _set_progress_indeterminate(self, indeterminate):
+        """進捗バーの不確定表示を切り替える（メインスレッドで実行）"""
+        def _update():
+            if indeterminate:
+                self.progress_bar.config(mode="indeterminate")
+                self.progress_bar.start()
+            else:
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate")
+        
+        self.root.after(0, _update)
+    
+    def set_status(self, text):
+        """ステータス表示を更新（次の_tickで反映される）"""
+        with self._ui_lock:
+            self._pending_status = text
+    
+    def set_progress(self, value):
+        """進捗バーを更新（次の_tickで反映される）"""
+        with self._ui_lock:
+            self._pending_progress = value
+    
     def log(self, message):
-        """ログメッセージを追加"""
-        def _log():
-            self.log_text.insert(tk.END, message + "\n")
+        """
+        ログメッセージを追加
+        
+        メッセージはバッファに貯め、_tickがメインスレッドでまとめて表示する。
+        """
+        with self._ui_lock:
+            self._log_buf.append(message)
+    
+    def _tick(self):
+        """貯まったステータス・進捗・ログをまとめて表示する（メインスレッドで定期実行）"""
+        with self._ui_lock:
+            status, self._pending_status = self._pending_status, None
+            progress, self._pending_progress = self._pending_progress, None
+            lines, self._log_buf = self._log_buf, []
+        
+        # 前回から変化があったものだけ反映する
+        if status is not None:
+            self.status_var.set(status)
+        if progress is not None:
+            self.progress_var.set(progress)
+        
+        if lines:
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            
+            # ログが増えすぎないよう古い行を削除
+            line_count = int(self.log_text.index("end-1c").split(".")[0])
+            if line_count > self.LOG_MAX_LINES:
+                self.log_text.delete("1.0", f"end-{self.LOG_MAX_LINES}lines")
+            
             self.log_text.see(tk.END)
         
-        # メインスレッドで実行
-        self.root.after(0, _log)
+        self.root.after(self.UI_TICK_INTERVAL_MS, self._tick)
 
 
 def main():